@@ -5,20 +5,128 @@ low tides that occur after sunrise and before sunset.
 
 Requires packages:
 requests
-beautifulsoup4
+selectolax
+
+Optional packages:
+requests-cache (set TIDES_CACHE=1 to cache responses on disk for an hour)
 """
 
-from collections import defaultdict
-from datetime import datetime, date, time
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time
+from functools import lru_cache
+from itertools import islice
 
 import requests
-from bs4 import BeautifulSoup, element as bs4_element
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser
+from urllib3.util.retry import Retry
+
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
 
 
 BASE_URL = "https://www.tide-forecast.com"
 TIDE_CLASS = "tide-day-tides"
-DATE_FORMAT = "%a %d %B"
-TIME_FORMAT = "%I:%M%p"
+REQUEST_TIMEOUT = 10
+MAX_WORKERS = 8
+CACHE_ENV_VAR = "TIDES_CACHE"
+CACHE_NAME = "tide_cache"
+CACHE_EXPIRE_SECONDS = 3600
+
+# class names and CSS selectors used to navigate the tide table
+_SEPARATOR_CLASS = 'tide-table__separator'
+_VALUE_CLASS = 'tide-table__value-low'
+_HEIGHT_CLASS = 'tide-table__height'
+_UNITS_CLASS = 'tide-table__units'
+_SEL_TABLE = 'table.tide-table__table'
+_SEL_DAY_TH = 'th.tide-table__day'
+_SEL_ROW = 'tr'
+_SEL_SEPARATOR = f'tr.{_SEPARATOR_CLASS}'
+_SEL_TD = 'td'
+_SEL_DIV = 'div'
+_SEL_SUN_TD = 'td.tide-table__part--sun'
+_SEL_TIDE_TD = 'td.tide-table__part--{}'
+_SEL_VALUE_HEIGHT_UNITS = f'span.{_VALUE_CLASS}, span.{_HEIGHT_CLASS}, span.{_UNITS_CLASS}'
+
+_SLUG_RE = re.compile(r'\s+')
+_COMMA_RE = re.compile(r'\s*,\s*')
+
+
+def _split_location(location):
+    parts = _COMMA_RE.split(location.strip())
+    if len(parts) != 2:
+        raise ValueError(f"expected 'city, state', got {location!r}")
+    return parts
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _make_session():
+    """
+    Build the keep-alive session shared by all requests to the tide forecast site.
+    Responses are cached on disk only when the TIDES_CACHE environment variable is set.
+    :return: requests.Session
+    """
+    if os.environ.get(CACHE_ENV_VAR, '') not in ('', '0'):
+        if requests_cache is None:
+            raise ImportError(f"{CACHE_ENV_VAR} is set but requests-cache is not installed")
+        session = requests_cache.CachedSession(
+            CACHE_NAME, backend='sqlite', use_cache_dir=True, expire_after=CACHE_EXPIRE_SECONDS
+        )
+    else:
+        session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    ))
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'User-Agent': 'gridium-tides/1.0 (+https://github.com/bw3817/gridium)',
+    })
+    return session
+
+
+def _get_session():
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = _make_session()
+    return _SESSION
+
+
+# the same handful of time strings recur throughout a tide table
+@lru_cache(maxsize=4096)
+def _parse_time_cached(time_str):
+    # times are always "H:MMam" or "H:MMpm", so skip strptime
+    hour, _, rest = time_str.strip().partition(':')
+    minute = int(rest[:-2])
+    am_pm = rest[-2:].lower()
+    if am_pm not in ('am', 'pm'):
+        raise ValueError(f"invalid time: {time_str!r}")
+    hour = int(hour)
+    if not 0 <= hour <= 12:
+        raise ValueError(f"invalid time: {time_str!r}")
+    return time(hour % 12 + (12 if am_pm == 'pm' else 0), minute)
+
+
+def _filter_between(tide_data, start, end):
+    """
+    Return the tides occurring between start and end, inclusive.
+    :param tide_data: list of (time, height, units) tuples
+    :param start: Python time object
+    :param end: Python time object
+    :return: list
+    """
+    return [row for row in tide_data if start <= row[0] <= end]
 
 
 class ScrapeTides:
@@ -28,199 +136,237 @@ class ScrapeTides:
     """
 
     @staticmethod
+    @lru_cache(maxsize=128)
     def parse_location(location):
         """
         Given a city, state combination, returns a string suitable for searching.
         :param location: str
         :return: str
         """
-        city, state = location.strip().split(',')
-        return f"{city.strip().replace(' ', '-')}-{state.strip().replace(' ', '-')}"
+        return '-'.join(_SLUG_RE.sub('-', part) for part in _split_location(location))
 
     @staticmethod
+    @lru_cache(maxsize=128)
     def get_location_without_state(location):
-        city, state = location.strip().split(',')
-        return f"{city.strip().replace(' ', '-')}"
-
-    @staticmethod
-    def force_hour_two_digits(time_str):
-        def fix_hour(hr):
-            return '12' if hr[-2:] == '00' else hr[-2:]
-        left_part, right_part = ('0' + time_str.strip()).split(':')
-        return fix_hour(left_part) + ':' + right_part
+        city, _ = _split_location(location)
+        return _SLUG_RE.sub('-', city)
 
     def parse_time_str(self, time_str):
         """
         Convert time string to a Python time.
         :param time_str: str
-        :param time_format: str
         """
         try:
-            return datetime.strptime(self.force_hour_two_digits(time_str), TIME_FORMAT).time()
+            return _parse_time_cached(time_str)
         except ValueError:
             return None
 
     @staticmethod
-    def adjust_year(date_obj):
-        """
-        Adjust year for the date object provided.
-        :param date_obj: Python date object
-        :return: Python date object
-        """
-        today = date.today()
-        if today.month == 12:
-            if date_obj.month == 1:
-                return date_obj.replace(year=today.year + 1)
-        return date_obj.replace(year=today.year)
-
-    def parse_date_str(self, date_str, date_format=DATE_FORMAT):
+    def parse_date_str(date_str):
         """
-        Convert date string to a Python date.
+        Convert an ISO 8601 date string (as found in data-date attributes) to a Python date.
         :param date_str: str
-        :param date_format: str
+        :return: Python date object, or None if the string is not a valid date
         """
         try:
-            return self.adjust_year(datetime.strptime(date_str, date_format).date())
+            return date.fromisoformat(date_str)
         except ValueError:
             return None
 
     @staticmethod
     def has_tide_info(tr, tide_type='low'):
-        tds = tr.find_all('td')
-        for td in tds:
-            if f'tide-table__part--{tide_type}' in td.attrs['class']:
-                return True
-        return False
-
-    @staticmethod
-    def get_value_height_unit(container):
-        value = container.find('span', attrs={'class': 'tide-table__value-low'})
-        height = container.find('span', attrs={'class': 'tide-table__height'})
-        units = container.find('span', attrs={'class': 'tide-table__units'})
-        return value, height, units
+        return tr.css_first(_SEL_TIDE_TD.format(tide_type)) is not None
 
     def get_data(self, td):
         data = list()
-        divs = td.find_all('div')
+        divs = td.css(_SEL_DIV)
 
         if len(divs) == 1:
-            value, height, units = self.get_value_height_unit(td)
-            if all((value, height, units)):
-                row = (self.parse_time_str(value.text), float(height.text), units.text)
-                data.append(row)
+            containers = (td,)
         elif len(divs) == 2:
-            for div in divs:
-                value, height, units = self.get_value_height_unit(div)
-                if all((value, height, units)):
-                    row = (self.parse_time_str(value.text), float(height.text), units.text)
-                    data.append(row)
+            containers = divs
+        else:
+            containers = ()
+
+        for container in containers:
+            found = {}
+            for span in container.css(_SEL_VALUE_HEIGHT_UNITS):
+                for cls in (span.attributes.get('class') or '').split():
+                    found.setdefault(cls, span)
+            value = found.get(_VALUE_CLASS)
+            height = found.get(_HEIGHT_CLASS)
+            units = found.get(_UNITS_CLASS)
+
+            if value is not None and height is not None and units is not None:
+                row = (self.parse_time_str(value.text()), float(height.text()), units.text())
+                data.append(row)
 
         return data
 
-    def get_tides(self, table, dates_from_table):
+    @staticmethod
+    def _has_class(node, cls):
+        return cls in (node.attributes.get('class') or '').split()
+
+    def _extract_tides_row(self, tr, dates_from_table):
         """
-        Parse HTML table and retrieve tides.
-        :param table: BeautifulSoup object representing an HTML table
+        Retrieve tides from a table row containing low tide information.
+        :param tr: selectolax Node representing an HTML table row
         :param dates_from_table: list
-        :param rise_and_set: list of tuples, each a pair of Python time objects
         :return: dict
         """
-        tides = defaultdict(list)
-        trs = table.find_all('tr', attrs={'class': 'tide-table__separator'})
-        for tr in trs:
-            if not self.has_tide_info(tr, 'low'):
+        tides = {dt: [] for dt, _ in dates_from_table}
+        get_data = self.get_data
+        tds = iter(tr.css(_SEL_TD))
+
+        # a day without a colspan occupies a single cell
+        for dt, cols in dates_from_table:
+            extend = tides[dt].extend
+            for td in islice(tds, cols or 1):
+                extend(get_data(td))
+
+        return tides
+
+    def _extract_sun_row(self, tds):
+        """
+        Retrieve sunrise and sunset times from the sun cells of a table row.
+        :param tds: list of selectolax Nodes representing HTML table cells
+        :return: list of lists, each a pair of Python time objects
+        """
+        times_ = list()
+        sunrise = None
+        sunset = None
+
+        for td in tds:
+            if not td.text():
                 continue
 
-            day = 0
-            td_index = 0
-            tds = tr.find_all('td')
+            if sunrise is None:
+                div = td.css_first(_SEL_DIV)
+                sunrise = self.parse_time_str(div.text(strip=True))
+            elif sunset is None:
+                div = td.css_first(_SEL_DIV)
+                sunset = self.parse_time_str(div.text(strip=True))
+            else:
+                divs = td.css(_SEL_DIV)
+                data = [self.parse_time_str(div.text(strip=True)) for div in divs]
+                if data and data != [None, None]:
+                    times_.append(data)
+
+        if sunrise and sunset:
+            times_.insert(0, [sunrise, sunset])
+        return times_
+
+    def _parse_rows(self, table, dates_from_table):
+        """
+        Walk the table rows once, retrieving both tides and sunrise/sunset times.
+        :param table: selectolax Node representing an HTML table
+        :param dates_from_table: list
+        :return: tuple of (dict of tides, list of sunrise/sunset pairs)
+        """
+        tides = None
+        rise_and_set = None
 
-            while True:
-                if td_index >= len(tds):
-                    return tides
+        for tr in table.css(_SEL_ROW):
+            if tides is None and self._has_class(tr, _SEPARATOR_CLASS) \
+                    and self.has_tide_info(tr, 'low'):
+                tides = self._extract_tides_row(tr, dates_from_table)
 
-                td = tds[td_index]
-                dt, cols = dates_from_table[day]
+            if rise_and_set is None:
+                tds = tr.css(_SEL_SUN_TD)
+                if tds:
+                    rise_and_set = self._extract_sun_row(tds)
 
-                if cols == 0:
-                    tides[dt] = self.get_data(td)
-                    td_index += 1
-                else:
-                    for _ in range(0, cols):
-                        td = tds[td_index]
-                        data = self.get_data(td)
-                        if data:
-                            tides[dt].extend(data)
-                        td_index += 1
+            if tides is not None and rise_and_set is not None:
+                break
 
-                day += 1
+        if tides is None:
+            tides = {dt: [] for dt, _ in dates_from_table}
+        return tides, rise_and_set
 
-    def get_rise_and_set(self, table):
-        for tr in table.find_all('tr'):
-            tds = tr.find_all('td', attrs={'class': 'tide-table__part--sun'})
-            if not tds:
-                continue
+    def get_tides(self, table, dates_from_table):
+        """
+        Parse HTML table and retrieve tides.
+        :param table: selectolax Node representing an HTML table
+        :param dates_from_table: list
+        :return: dict
+        """
+        for tr in table.css(_SEL_SEPARATOR):
+            if self.has_tide_info(tr, 'low'):
+                return self._extract_tides_row(tr, dates_from_table)
 
-            times_ = list()
-            sunrise = None
-            sunset = None
-
-            for td in tds:
-                if not td.text:
-                    continue
-
-                if sunrise is None:
-                    div = td.find('div')
-                    sunrise = self.parse_time_str(div.text.strip())
-                elif sunset is None:
-                    div = td.find('div')
-                    sunset = self.parse_time_str(div.text.strip())
-                else:
-                    divs = td.find_all('div')
-                    data = [self.parse_time_str(div.text.strip()) for div in divs]
-                    if data and data != [None, None]:
-                        times_.append(data)
-
-            if sunrise and sunset:
-                times_.insert(0, [sunrise, sunset])
-            return times_
+    def get_rise_and_set(self, table):
+        for tr in table.css(_SEL_ROW):
+            tds = tr.css(_SEL_SUN_TD)
+            if tds:
+                return self._extract_sun_row(tds)
 
     @staticmethod
     def get_dates_from_table(table):
         """
         Parse HTML table and retrieve tides.
-        :param table: BeautifulSoup object representing an HTML table
+        :param table: selectolax Node representing an HTML table
         :return: list
         """
-        ths = table.find_all('th', attrs={'class': 'tide-table__day'})
+        # Node.attributes builds a new dict on each access; read it once per th
+        fromisoformat = date.fromisoformat
+        return [
+            (fromisoformat(attrs['data-date']), int(attrs.get('colspan') or 0))
+            for attrs in (th.attributes for th in table.css(_SEL_DAY_TH))
+        ]
+
+    @staticmethod
+    def _url_for(slug):
+        return f"{BASE_URL}/locations/{slug}/tides/latest"
+
+    def _build_urls(self, location):
+        """
+        URLs to try for a location, in order of preference.
+        :param location: str
+        :return: list of str, [primary, fallback]
+        """
         return [
-            (date.fromisoformat(th.attrs['data-date']), int(th.attrs.get('colspan', 0)))
-            for th in ths
+            self._url_for(self.parse_location(location)),
+            # location not found; try without state name
+            self._url_for(self.get_location_without_state(location)),
         ]
 
+    @staticmethod
+    def _fetch_html(url):
+        # hand the raw bytes to the parser rather than decoding to str first
+        with _get_session().get(url, stream=True, timeout=REQUEST_TIMEOUT) as page:
+            return page.content
+
+    @staticmethod
+    def _parse_table(html):
+        tree = LexborHTMLParser(html)
+        return tree.css_first(_SEL_TABLE)
+
     def get_from_url(self, url):
-        page = requests.get(url)
-        soup = BeautifulSoup(page.text, "html.parser")
-        table = soup.find('table', attrs={'class': 'tide-table__table'})
-        if table:
-            return table
+        return self._parse_table(self._fetch_html(url))
 
     def get_table(self, location):
-        parsed_location = self.parse_location(location)
-        url = f"{BASE_URL}/locations/{parsed_location}/tides/latest"
-        table = self.get_from_url(url)
-        if table:
-            return table
-
-        # page = requests.get(url)
-        # soup = BeautifulSoup(page.text, "html.parser")
-        # table = soup.find('table', attrs={'class': 'tide-table__table'})
-
-        # location not found; try without state name
-        location_without_state = self.get_location_without_state(location)
-        url = f"{BASE_URL}/locations/{location_without_state}/tides/latest"
-        table = self.get_from_url(url)
-        return table
+        """
+        Fetch the tide table for a location. When the fallback URL differs from
+        the primary one, both pages are requested concurrently; the primary page
+        is preferred when it has a table.
+        :param location: str
+        :return: selectolax Node representing an HTML table, or None
+        """
+        urls = list(dict.fromkeys(self._build_urls(location)))
+        if len(urls) == 1:
+            return self.get_from_url(urls[0])
+
+        pool = ThreadPoolExecutor(max_workers=len(urls))
+        try:
+            futures = [pool.submit(self._fetch_html, url) for url in urls]
+            for future in futures:
+                table = self._parse_table(future.result())
+                if table is not None:
+                    return table
+            return None
+        finally:
+            # return without waiting; an unneeded fallback request finishes in the background
+            pool.shutdown(wait=False)
 
     def extract_tides(self, location):
         """
@@ -228,17 +374,25 @@ class ScrapeTides:
         :param location: str
         :return: dict containing Tide instances
         """
-        table = self.get_table(location)
+        return self.extract_tides_from_table(self.get_table(location))
+
+    def extract_tides_from_table(self, table):
+        """
+        Extract low tides occurring in daylight from an already fetched table.
+        :param table: selectolax Node representing an HTML table
+        :return: dict containing Tide instances
+        """
         dates_from_table = self.get_dates_from_table(table)
-        rise_and_set = self.get_rise_and_set(table)
-        tides_for_location = self.get_tides(table, dates_from_table)
+        tides_for_location, rise_and_set = self._parse_rows(table, dates_from_table)
 
-        filtered_tides = defaultdict(list)
+        filtered_tides = {}
 
         for indx, (dt, tide_data) in enumerate(tides_for_location.items()):
-            for tide_time, value, units in tide_data:
-                if rise_and_set[indx][0] <= tide_time <= rise_and_set[indx][1]:
-                    filtered_tides[dt].append((tide_time, value, units))
+            if not tide_data:
+                continue
+            daylight = _filter_between(tide_data, rise_and_set[indx][0], rise_and_set[indx][1])
+            if daylight:
+                filtered_tides[dt] = daylight
 
         return filtered_tides
 
@@ -253,8 +407,12 @@ class ScrapeTides:
             'Providence, Rhode Island',
             'Wrightsville Beach, North Carolina',
         )
-        for location in locations:
-            tides = self.extract_tides(location)
+        # fetch and parse pages concurrently; network dominates each location
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(locations))) as pool:
+            tables = list(pool.map(self.get_table, locations))
+
+        for location, table in zip(locations, tables):
+            tides = self.extract_tides_from_table(table)
             print('\nLocation:', location)
             for dt, tide_rows in tides.items():
                 for tide_row in tide_rows: